@@ -1,31 +1,94 @@
+import concurrent.futures
+import contextlib
 import subprocess
 import re
 import argparse
+import bisect
+import collections
+import functools
+import hashlib
 import json
 import sys
 import os
-
+import platform
+import shutil
+import struct
+import tempfile
+import threading
+import tomllib
+
+import simavr_wrapper
+
+# The DEPTHS array in build.rs. Anchored to a line start so a commented-out copy can't match.
+_DEPTHS_RE = re.compile(r"^const DEPTHS: &\[usize\] = &\[([^\]]*)\];", re.MULTILINE)
+_DEPTH_VALUE_RE = re.compile(r"\d+")
+_LINE_COMMENT_RE = re.compile(r"//[^\n]*")
+_STACK_RE = re.compile(rb"Max stack usage: (\d+) bytes")
+# Header line llvm-objdump prints before the disassembly, e.g. `foo.elf:  file format elf32-avr`
+_ELF_FORMAT_RE = re.compile(r"\.elf:.*file format")
+
+# Panic-related patterns to search for (specific function names only)
+_PANIC_PATTERNS = [
+    r'panic_fmt',
+    r'panic_const',
+    r'panic_nounwind',
+    r'panic_impl',
+    r'assert_failed',
+    r'unwrap_failed',
+    r'expect_failed',
+    r'slice_end_index_len_fail',
+    r'slice_start_index_len_fail',
+    r'slice_index_len_fail',
+    r'panic_for_nonpositive_argument',
+    r'panic_bounds_check',
+    r'unreachable_unchecked',
+    r'core::panicking::',
+    r'panic!',
+    r'unwrap\(\)',
+    r'expect\(',
+]
+# All panic patterns fused into one alternation, so the disassembly is scanned once
+_PANIC_RE = re.compile("|".join(f"(?:{p})" for p in _PANIC_PATTERNS), re.IGNORECASE)
+# The same alternation for lowercased text. The patterns are all lowercase, and a
+# case-sensitive search is several times faster than re.IGNORECASE over large blocks.
+_PANIC_LOWER_RE = re.compile(_PANIC_RE.pattern)
+# Every panic pattern contains one of these literals, so they can be located with str.find
+_PANIC_HINTS = ("panic", "fail", "unwrap", "expect", "unreachable")
+# Disassembly lines worth scanning start with one of these: indented instructions, `;`
+# source and line-info comments, or the hex address of a function header
+_SCAN_LINE_STARTS = frozenset(" \t;0123456789abcdef")
+# Disassembler comments that contain false positive int_log10 references
+_FALSE_POSITIVE_RE = re.compile(r'^ *;.*int_log10::panic_for_nonpositive_argument')
+# Function header lines, e.g. `00000130 <core::result::unwrap_failed>:`
+_FUNC_HEADER_RE = re.compile(r'^[0-9a-f]+ <(.+)>:$', re.MULTILINE)
+# objdump output is scanned in blocks of whole lines of about this many characters
+_SCAN_BLOCK_SIZE = 1 << 20
+
+# Stack results are cached here, keyed by a hash of the simulated binary.
+_CACHE_DIR = os.path.expanduser("~/.cache/picojson")
+
+def _parse_depths(content):
+    """Extracts the DEPTHS constant from the build.rs source."""
+    match = _DEPTHS_RE.search(content)
+    if match:
+        # Pick out the numbers, which also copes with trailing commas and `7usize` suffixes
+        body = _LINE_COMMENT_RE.sub("", match.group(1))
+        return [int(d) for d in _DEPTH_VALUE_RE.findall(body)]
+    # No match found - return empty list for consistency
+    return []
+
+@functools.lru_cache(maxsize=1)
 def get_depths_from_build_rs():
     """Parses build.rs to extract the DEPTHS constant."""
     try:
         with open("build.rs", "r") as f:
-            content = f.read()
-            match = re.search(r"const DEPTHS: &\[usize\] = &\[(.*?)\];", content, re.DOTALL)
-            if match:
-                depths_str = match.group(1).replace('\n', '').replace(',', ' ').split()
-                return [int(d) for d in depths_str]
-            else:
-                # No match found - return empty list for consistency
-                return []
+            return _parse_depths(f.read())
     except (IOError, ValueError) as e:
         print(f"Could not read or parse DEPTHS from build.rs: {e}", file=sys.stderr)
         return []  # Return a default or empty list
 
 # --- Test Configuration ---
 
-# The different nesting depths to test, matching the Cargo features.
-DEPTHS = get_depths_from_build_rs()
-
 # The test configurations to run.
 # (Test Name, Cargo Example Name, Extra Features)
 CONFIGS = [
@@ -38,68 +101,358 @@ CONFIGS = [
     ("stream-huge", "test_streamparser", ["pico-huge","ufmt", "int8"]),
 ]
 
-def run_stack_analysis():
-    """Runs the stack size analysis for different depths and configurations."""
-    results = {}
-    for depth in DEPTHS:
-        depth_results = {}
-        for name, example, extra_features in CONFIGS:
-            print(f"Running {name} at depth {depth}...")
-
-            # Construct the cargo command
-            features = [f"depth-{depth}"] + extra_features
-            command = ["cargo", "run", "--release", "--no-default-features"]
-            if features:
-                command.append("--features")
-                command.append(",".join(features))
-            command.extend(["--example", example])
-
-            # Execute the command
+def _cargo_config_files():
+    """Returns the cargo config files that apply in the current directory, highest precedence first."""
+    directories = []
+    directory = os.getcwd()
+    while True:
+        directories.append(os.path.join(directory, ".cargo"))
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    cargo_home = os.environ.get("CARGO_HOME", os.path.expanduser(os.path.join("~", ".cargo")))
+    if os.path.abspath(cargo_home) not in directories:
+        directories.append(cargo_home)
+
+    files = []
+    for directory in directories:
+        # Like cargo, prefer the extensionless `config` when both exist
+        for name in ("config", "config.toml"):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                files.append(path)
+                break
+    return files
+
+def _cargo_runner():
+    """Returns the avr-none runner cargo would use as an argv list, or None if there is none."""
+    runner = os.environ.get("CARGO_TARGET_AVR_NONE_RUNNER")
+    source = "CARGO_TARGET_AVR_NONE_RUNNER"
+    if runner is None:
+        for path in _cargo_config_files():
             try:
-                print(f"Running command: {' '.join(command)}")
-                output = subprocess.check_output(command, stderr=subprocess.STDOUT, universal_newlines=True)
-
-                # Parse the output
-                if "JSON parsing failed!" in output:
-                    result_str = "Clean Fail"
-                elif "=== TEST COMPLETE ===" in output:
-                    match = re.search(r"Max stack usage: (\d+) bytes", output)
-                    if match:
-                        result_str = f"{match.group(1)} bytes"
-                    else:
-                        result_str = "Success (No Stack)"
-                else:
-                    result_str = "Stack Overflow"
-
-            except UnicodeDecodeError:
-                # Handle case where output contains binary garbage (stack overflow)
-                result_str = "Stack Overflow (Binary Output)"
-            except subprocess.CalledProcessError as e:
-                result_str = f"Build Failed: {e.output}"
+                with open(path, "rb") as f:
+                    runner = tomllib.load(f).get("target", {}).get("avr-none", {}).get("runner")
+            except (IOError, tomllib.TOMLDecodeError, AttributeError) as e:
+                print(f"Could not read cargo config {path}: {e!r}", file=sys.stderr)
+                sys.exit(1)
+            if runner is not None:
+                source = path
+                break
+    if runner is None:
+        return None
+    # Cargo splits a string runner on whitespace, without shell quoting
+    argv = runner.split() if isinstance(runner, str) else list(runner)
+    if not argv or not all(isinstance(arg, str) for arg in argv):
+        print(f"Invalid avr-none runner in {source}: {runner!r}", file=sys.stderr)
+        sys.exit(1)
+    return argv
+
+@functools.lru_cache(maxsize=1)
+def _simavr_settings():
+    """Returns (runner argv, simavr args, timeout) for avr-none, the argv being None for simavr_wrapper.py."""
+    argv = _cargo_runner()
+    if argv is None:
+        print("No runner is configured for avr-none, set one in .cargo/config.toml", file=sys.stderr)
+        sys.exit(1)
+    # Everything after the wrapper script is the wrapper's own arguments. Any other
+    # runner is run as is, like `cargo run` would.
+    wrapper = next((i for i, arg in enumerate(argv) if os.path.basename(arg) == "simavr_wrapper.py"), None)
+    if wrapper is None:
+        return argv, [], None
+    timeout_seconds, simavr_args = simavr_wrapper.split_timeout(argv[wrapper + 1:])
+    return None, simavr_args, timeout_seconds
+
+def _parallel_workers():
+    """Number of objdump scans to run concurrently, leaving headroom for the host."""
+    return max(1, (os.cpu_count() or 1) - 2)
+
+def _stack_pool_sizes():
+    """Returns (cargo jobs, run workers), giving each simulator run a CPU and the build the rest."""
+    cpus = os.cpu_count() or 1
+    run_workers = max(1, min(len(CONFIGS), cpus // 4))
+    # Cargo serializes builds in the shared target dir, so a single build worker gets
+    # every CPU the simulator runs leave free
+    jobs = max(1, cpus - run_workers)
+    return jobs, run_workers
+
+def _suite_dir():
+    """Returns the directory under the cargo target dir where the suite keeps built binaries."""
+    target_root = os.environ.get("CARGO_TARGET_DIR", "target")
+    return os.path.join(target_root, "suite")
+
+def _use_native_target_dir_on_wsl():
+    """Moves cargo build output off the Windows filesystem when running from /mnt under WSL."""
+    if "microsoft" not in platform.uname().release.lower() or not os.getcwd().startswith("/mnt/"):
+        return
+    target_dir = os.environ.setdefault("CARGO_TARGET_DIR", os.path.expanduser("~/.cache/picojson-target"))
+    print(f"Warning: running from a Windows mount under WSL, using CARGO_TARGET_DIR={target_dir}", file=sys.stderr)
+    if "/mnt/c" in os.environ.get("PATH", ""):
+        print("Warning: PATH contains Windows directories, consider appendWindowsPath=false in /etc/wsl.conf", file=sys.stderr)
+
+def _prefetch_dependencies():
+    """Fetches crate dependencies once so the builds can run offline."""
+    command = ["cargo", "fetch"]
+    try:
+        print(f"Running command: {' '.join(command)}")
+        subprocess.check_output(command, stderr=subprocess.STDOUT, universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Warning: cargo fetch failed, builds will stay online: {e.output}", file=sys.stderr)
+        return
+    os.environ.setdefault("CARGO_NET_OFFLINE", "true")
+
+def _cargo_artifacts(command, env=None):
+    """Runs a cargo command with JSON messages, yielding (target name, executable) as each is built."""
+    with tempfile.TemporaryFile(mode="w+") as stderr_file:
+        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file, universal_newlines=True, env=env) as proc:
+            for line in proc.stdout:
+                # Of the JSON messages only the artifacts matter, so skip decoding everything else
+                if not line.startswith("{") or '"compiler-artifact"' not in line:
+                    continue
+                message = json.loads(line)
+                if message.get("reason") == "compiler-artifact" and message.get("executable"):
+                    yield message["target"]["name"], message["executable"]
+        if proc.returncode != 0:
+            stderr_file.seek(0)
+            raise subprocess.CalledProcessError(proc.returncode, command, output=stderr_file.read())
+
+def _build_example(example, features, env):
+    """Builds an example with cargo and returns the path to the produced executable."""
+    command = ["cargo", "build", "--release", "--no-default-features", "--message-format=json-render-diagnostics"]
+    if features:
+        command.append("--features")
+        command.append(",".join(features))
+    command.extend(["--example", example])
+
+    print(f"Running command: {' '.join(command)}")
+    executable = dict(_cargo_artifacts(command, env)).get(example)
+    if executable is None:
+        raise subprocess.CalledProcessError(0, command, output=f"No executable produced for {example}")
+    return executable
+
+def _simulate(executable):
+    """Runs a built example under simavr, returning (result string, whether the run reached a verdict)."""
+    runner, simavr_args, timeout_seconds = _simavr_settings()
+    try:
+        if runner is not None:
+            command = runner + [executable]
+        else:
+            command = simavr_wrapper.simavr_command(executable, simavr_args, timeout_seconds)
+    except (OSError, subprocess.CalledProcessError) as e:
+        return f"Run Failed: {e}", False
+    print(f"Running command: {' '.join(command)}")
+
+    parse_failed = False
+    complete = False
+    binary_output = False
+    stack_usage = None
+    # The last few lines explain a run that failed for reasons other than the target
+    tail = collections.deque(maxlen=5)
+    try:
+        # Read bytes, the markers are ASCII and a stack overflowing target emits garbage
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except FileNotFoundError as e:
+        return f"Run Failed: {e}", False
+    with proc:
+        for line in proc.stdout:
+            # Undecodable bytes mean the target is spewing garbage (stack overflow).
+            # Once that's known, the rest of the output needn't be decoded at all.
+            if not binary_output:
+                try:
+                    line.decode("utf-8")
+                except UnicodeDecodeError:
+                    binary_output = True
+            if not binary_output:
+                tail.append(line)
+            if b"JSON parsing failed!" in line:
+                parse_failed = True
+            # A failed parse is reported as such whatever the stack usage, and the regex
+            # only needs to run on the line that carries it
+            if not parse_failed and b"Max stack usage" in line:
+                match = _STACK_RE.search(line)
+                if match:
+                    stack_usage = match.group(1).decode()
+            if b"=== TEST COMPLETE ===" in line:
+                complete = True
+                break
+        if proc.poll() is None:
+            proc.terminate()
+        returncode = proc.wait()
+
+    if parse_failed:
+        return "Clean Fail", True
+    if complete:
+        return (f"{stack_usage} bytes" if stack_usage else "Success (No Stack)"), True
+    if binary_output:
+        return "Stack Overflow (Binary Output)", False
+    # 124 is `timeout` giving up on a target that never finished. Any other failure
+    # (e.g. 127, simavr not installed) is the harness's problem, not a stack overflow.
+    if returncode not in (0, 124):
+        output = " | ".join(line.decode().strip() for line in tail if line.strip())
+        return f"Run Failed: exit {returncode}: {output}", False
+    return "Stack Overflow", False
+
+def _run_executable(executable):
+    """Runs a built example under simavr and classifies its output."""
+    return _simulate(executable)[0]
+
+def _run_executable_cached(executable):
+    """Runs a built example like _run_executable, reusing the cached result for an identical binary."""
+    version = simavr_wrapper.simavr_version()
+    if version is None:
+        return _run_executable(executable)
+    digest = hashlib.sha256(json.dumps([*_simavr_settings(), version]).encode())
+    try:
+        with open(executable, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except IOError:
+        return _run_executable(executable)
+    cache_file = os.path.join(_CACHE_DIR, "runs", f"{digest.hexdigest()[:16]}.txt")
+    try:
+        with open(cache_file, "r") as f:
+            result_str = f.read()
+        print(f"Using cached result for {executable}")
+        return result_str
+    except IOError:
+        pass
+
+    # Only runs that reached a verdict are cached, an overflow may just be a slow machine timing out
+    result_str, reached_verdict = _simulate(executable)
+    if reached_verdict:
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file, "w") as f:
+                f.write(result_str)
+        except IOError:
+            pass  # Caching is best effort
+    return result_str
+
+def _build_config(name, example, extra_features, depths, jobs, run_executor, run):
+    """Builds one configuration at each depth, returning {depth: future of its run on run_executor}."""
+    env = {**os.environ, "CARGO_BUILD_JOBS": str(jobs)}
+    runs_dir = os.path.join(_suite_dir(), "runs")
+
+    runs = {}
+    for depth in depths:
+        features = [f"depth-{depth}"] + extra_features
+        try:
+            executable = _build_example(example, features, env)
+        except subprocess.CalledProcessError as e:
+            runs[depth] = concurrent.futures.Future()
+            runs[depth].set_result(f"Build Failed: {e.output}")
+            continue
+
+        # The next depth's build overwrites the executable, so run a copy of it
+        run_path = os.path.join(runs_dir, f"{name}-depth-{depth}.elf")
+        try:
+            os.makedirs(runs_dir, exist_ok=True)
+            shutil.copyfile(executable, run_path)
+        except OSError as e:
+            runs[depth] = concurrent.futures.Future()
+            runs[depth].set_result(f"Run Failed: {e}")
+            continue
+        runs[depth] = run_executor.submit(run, run_path)
+    return runs
 
-            print(f"  Result: {result_str}")
-            depth_results[name] = result_str
+def run_stack_analysis(depths=None, use_cache=False):
+    """Runs the stack size analysis for different depths and configurations."""
+    if depths is None:
+        depths = get_depths_from_build_rs()
+    run = _run_executable_cached if use_cache else _run_executable
+    # Read the runner settings up front, so a bad config fails before anything is built
+    _simavr_settings()
+    _prefetch_dependencies()
+
+    results = {depth: {} for depth in depths}
+    jobs, run_workers = _stack_pool_sizes()
+    print(f"Running {len(CONFIGS)} configuration(s) x {len(depths)} depth(s) with "
+          f"{jobs} cargo job(s) and {run_workers} run worker(s)...")
+
+    # Builds and simulator runs get separate pools, so simulator runs overlap the builds
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as build_executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=run_workers) as run_executor:
+        build_futures = [
+            (name, build_executor.submit(_build_config, name, example, extra_features, depths, jobs, run_executor, run))
+            for name, example, extra_features in CONFIGS
+        ]
+        runs = {}
+        for name, build_future in build_futures:
+            for depth, run_future in build_future.result().items():
+                runs[run_future] = (depth, name)
+        for future in concurrent.futures.as_completed(runs):
+            depth, name = runs[future]
+            result_str = future.result()
+            print(f"  Result: {name} at depth {depth}: {result_str}")
+            results[depth][name] = result_str
 
-        results[depth] = depth_results
     return results
 
 def print_stack_report(results):
     """Prints a markdown table of the stack analysis results."""
     header = "| Nesting Depth | " + " | ".join([c[0] for c in CONFIGS]) + "|"
     separator = "|---" * (len(CONFIGS) + 1) + "|"
-    print("\n\n--- Stack Analysis Results ---")
-    print(header)
-    print(separator)
+    lines = ["\n\n--- Stack Analysis Results ---", header, separator]
 
     for depth in sorted(results.keys()):
-        row = f"| {depth} levels |"
-        for name, _, _ in CONFIGS:
-            row += f" {results[depth].get(name, 'N/A')} |"
-        print(row)
+        cells = " | ".join(results[depth].get(name, 'N/A') for name, _, _ in CONFIGS)
+        lines.append(f"| {depth} levels | {cells} |")
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def _elf_section_size(path, section_name=b".text"):
+    """Returns the size of a named section in an ELF file, or None if it has no such section."""
+    with open(path, "rb") as f:
+        header = f.read(0x40)
+        if header[:4] != b"\x7fELF":
+            raise ValueError(f"{path} is not an ELF file")
+        endian = "<" if header[5] == 1 else ">"
+        if header[4] == 1:  # ELFCLASS32
+            shoff, = struct.unpack_from(endian + "I", header, 0x20)
+            shentsize, shnum, shstrndx = struct.unpack_from(endian + "HHH", header, 0x2E)
+            section_format = endian + "IIIIII"
+        else:  # ELFCLASS64
+            shoff, = struct.unpack_from(endian + "Q", header, 0x28)
+            shentsize, shnum, shstrndx = struct.unpack_from(endian + "HHH", header, 0x3A)
+            section_format = endian + "IIQQQQ"
+
+        f.seek(shoff)
+        table = f.read(shnum * shentsize)
+        # (sh_name, sh_offset, sh_size) of each section
+        sections = []
+        for i in range(shnum):
+            name_index, _, _, _, offset, size = struct.unpack_from(section_format, table, i * shentsize)
+            sections.append((name_index, offset, size))
+        _, names_offset, names_size = sections[shstrndx]
+        f.seek(names_offset)
+        names = f.read(names_size)
+
+    for name_index, _, size in sections:
+        if names[name_index:names.index(b"\0", name_index)] == section_name:
+            return size
+    return None
+
+def _run_bloat_one(name, example, extra_features):
+    """Builds one configuration and returns the formatted size of its .text section."""
+    print(f"Running bloat for {name}...")
+
+    try:
+        executable = _build_example(example, extra_features, None)
+    except subprocess.CalledProcessError as e:
+        return f"Bloat Failed: {e.output}"
+
+    try:
+        file_size = _elf_section_size(executable)
+    except (IOError, ValueError, struct.error) as e:
+        return f"Bloat Failed: {e}"
+    if file_size is None:
+        return "Bloat Failed: No .text section"
+    file_size_kb = file_size / 1024
+    return f"{file_size_kb:.1f} KB"
 
 def run_bloat_analysis():
-    """Runs cargo-bloat and reports on binary size."""
-    print("Running binary size analysis with cargo-bloat...")
+    """Builds each configuration and reports on its binary size."""
+    print("Running binary size analysis...")
     results = {}
 
     bloat_configs = [
@@ -107,38 +460,10 @@ def run_bloat_analysis():
         ("picojson-slice", "test_picojson", ["pico-tiny", "int8"]),
         ("picojson-stream", "test_streamparser", ["pico-tiny", "int8"]),
     ]
-
     # Bloat analysis doesn't depend on nesting depth, so we run it once for each config.
+    # The configs share the target dir, so cargo would serialize concurrent builds anyway.
     for name, example, extra_features in bloat_configs:
-        print(f"Running bloat for {name}...")
-
-        # Construct the cargo bloat command
-        command = ["cargo", "bloat", "--release", "--message-format=json"]
-        if extra_features:
-            command.extend(
-                (
-                    "--no-default-features",
-                    "--features",
-                    ",".join(extra_features),
-                )
-            )
-        command.extend(["--example", example])
-
-        try:
-            print(f"Running command: {' '.join(command)}")
-            output = subprocess.check_output(command, stderr=subprocess.STDOUT, universal_newlines=True)
-            # Get the last line of output, which should be the JSON
-            json_output = output.strip().split('\n')[-1]
-            data = json.loads(json_output)
-            # The file size is in the 'text-section-size' field of the JSON output
-            file_size = data.get('text-section-size', 0)
-            file_size_kb = file_size / 1024
-            results[name] = f"{file_size_kb:.1f} KB"
-
-        except subprocess.CalledProcessError as e:
-            results[name] = f"Bloat Failed: {e.output}"
-        except (json.JSONDecodeError, IndexError):
-            results[name] = "Bloat Failed: Invalid JSON"
+        results[name] = _run_bloat_one(name, example, extra_features)
 
     return results
 
@@ -146,158 +471,305 @@ def print_bloat_report(results):
     """Prints a markdown table of the bloat analysis results."""
     header = "| Configuration | Binary Size |"
     separator = "|---|---|"
-    print("\n\n--- Binary Size Analysis (cargo-bloat) ---")
-    print(header)
-    print(separator)
+    lines = ["\n\n--- Binary Size Analysis (.text section) ---", header, separator]
 
     for name, size in results.items():
-        row = f"| {name} | {size} |"
-        print(row)
+        lines.append(f"| {name} | {size} |")
+    sys.stdout.write("\n".join(lines) + "\n")
+
+# Disassembly flags, as previously passed through `cargo objdump --`
+_OBJDUMP_ARGS = ["-dS", "-l", "-z", "--show-all-symbols"]
 
-def _run_objdump(example_name, profile, verbose, no_default_features, features):
-    """Executes the cargo objdump command and returns the process result."""
-    cmd = ["cargo", "objdump", "--profile", profile]
+@functools.lru_cache(maxsize=1)
+def _llvm_objdump():
+    """Locates llvm-objdump, preferring the one from the toolchain's llvm-tools component."""
+    try:
+        sysroot = subprocess.check_output(["rustc", "--print", "sysroot"], universal_newlines=True).strip()
+        version_info = subprocess.check_output(["rustc", "-vV"], universal_newlines=True)
+        host = next(line.split(":", 1)[1].strip() for line in version_info.splitlines() if line.startswith("host:"))
+        exe_suffix = ".exe" if os.name == "nt" else ""
+        candidate = os.path.join(sysroot, "lib", "rustlib", host, "bin", f"llvm-objdump{exe_suffix}")
+        if os.path.exists(candidate):
+            return candidate
+    except (OSError, subprocess.CalledProcessError, StopIteration):
+        pass
+    return shutil.which("llvm-objdump") or "llvm-objdump"
+
+def _build_examples(examples, profile, verbose, no_default_features, features):
+    """Builds the examples in a single cargo invocation, yielding (name, ELF path) as each is built."""
+    # --keep-going so an example that fails to compile doesn't stop the others being built
+    cmd = ["cargo", "build", "--keep-going", "--profile", profile, "--message-format=json-render-diagnostics"]
     if no_default_features:
         cmd.append("--no-default-features")
     if features:
         cmd.extend(["--features", features])
-    cmd.extend(["--example", example_name, "--", "-dS","-l","-z","--show-all-symbols"])
+    for example_name in examples:
+        cmd.extend(["--example", example_name])
 
     if verbose:
         print(f"Running: {' '.join(cmd)}")
 
-    return subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=120  # 2 minute timeout
-    )
-
-def _filter_objdump_output(stdout):
-    """Extracts relevant sections from the objdump output."""
-    lines = stdout.split('\n')
-    start_idx = None
-    for i, line in enumerate(lines):
-        if '.elf:' in line and 'file format' in line:
-            start_idx = i
+    yield from _cargo_artifacts(cmd)
+
+def _filter_objdump_output(stream, collect):
+    """Yields the objdump output after the file format marker in whole-line blocks, passing each to collect."""
+    # Find the marker with a regex search over whole blocks rather than line by line.
+    # It can't span lines, so each search resumes at the start of the last partial line.
+    pending = ""
+    carry = None
+    while carry is None:
+        data = stream.read(_SCAN_BLOCK_SIZE)
+        if not data:
             break
-    if start_idx is None:
+        search_from = pending.rfind('\n') + 1
+        pending += data
+        match = _ELF_FORMAT_RE.search(pending, search_from)
+        if match:
+            carry = pending[pending.rfind('\n', 0, match.start()) + 1:]
+    if carry is None:
         print("Warning: Could not find .elf file format marker", file=sys.stderr)
-        return stdout
-    return '\n'.join(lines[start_idx:])
+        carry = pending
 
-def _save_assembly_output(example_name, profile, content):
-    """Writes the filtered output to a file and returns the file path."""
+    while True:
+        data = stream.read(_SCAN_BLOCK_SIZE)
+        if not data:
+            break
+        cut = data.rfind('\n') + 1
+        if not cut:
+            carry += data
+            continue
+        block, carry = carry + data[:cut], data[cut:]
+        collect(block)
+        yield block
+    if carry:
+        if not carry.endswith('\n'):
+            carry += '\n'
+        collect(carry)
+        yield carry
+
+def _assembly_path(example_name, profile):
+    """Returns the path an example's filtered disassembly is saved to, creating its directory."""
     output_dir = f"target/avr-none/{profile}/examples"
     os.makedirs(output_dir, exist_ok=True)
-    asm_file = f"{output_dir}/{example_name}.asm"
+    return f"{output_dir}/{example_name}.asm"
+
+def _assembly_saved_message(asm_file, partial):
+    """Returns the message reporting where the assembly was saved."""
+    if partial:
+        return f"💾 Partial assembly (scan stopped at the first panic reference) saved to: {asm_file}"
+    return f"💾 Assembly saved to: {asm_file}"
+
+def _save_assembly_output(example_name, profile, asm_blocks, partial=False):
+    """Writes the filtered output to a file and returns the file path."""
+    asm_file = _assembly_path(example_name, profile)
     try:
-        with open(asm_file, 'w') as f:
-            f.write(content)
-        print(f"💾 Assembly saved to: {asm_file}")
+        # A 1 MiB buffer keeps multi-MB disassemblies to a handful of write syscalls,
+        # without first joining them into one more big string
+        with open(asm_file, 'w', buffering=1 << 20) as f:
+            f.writelines(asm_blocks)
+        print(_assembly_saved_message(asm_file, partial))
     except Exception as e:
         print(f"⚠️  Warning: Could not save assembly file: {e}")
     return asm_file
 
-def _analyze_panic_patterns(content, verbose):
-    """Scans the output for panic patterns and returns found references."""
-    # Panic-related patterns to search for (specific function names only)
-    panic_patterns = [
-        r'panic_fmt',
-        r'panic_const',
-        r'panic_nounwind',
-        r'panic_impl',
-        r'assert_failed',
-        r'unwrap_failed',
-        r'expect_failed',
-        r'slice_end_index_len_fail',
-        r'slice_start_index_len_fail',
-        r'slice_index_len_fail',
-        r'panic_for_nonpositive_argument',
-        r'panic_bounds_check',
-        r'unreachable_unchecked',
-        r'core::panicking::',
-        r'panic!',
-        r'unwrap\(\)',
-        r'expect\(',
-    ]
+def _panic_line_matches(block):
+    """Yields (line start, line end, match) for the first panic pattern match on each line of block."""
+    lowered = block.lower()
+    if len(lowered) != len(block):
+        # Some non-ASCII case mappings change length, which would shift the offsets,
+        # so fall back to a case-insensitive regex scan of the whole block
+        pos = 0
+        while True:
+            panic_match = _PANIC_RE.search(block, pos)
+            if not panic_match:
+                return
+            start = block.rfind('\n', 0, panic_match.start()) + 1
+            end = block.find('\n', panic_match.end())
+            if end == -1:
+                end = len(block)
+            yield start, end, panic_match
+            pos = end + 1
+
+    # Jump between occurrences of the hint literals with str.find, which runs far faster
+    # than the regex engine, and only run the regex on the few lines that contain one
+    next_hits = {hint: lowered.find(hint) for hint in _PANIC_HINTS}
+    pos = 0
+    while True:
+        for hint, hit in next_hits.items():
+            if 0 <= hit < pos:
+                next_hits[hint] = lowered.find(hint, pos)
+        hits = [hit for hit in next_hits.values() if hit >= 0]
+        if not hits:
+            return
+        hit = min(hits)
+        start = lowered.rfind('\n', 0, hit) + 1
+        end = lowered.find('\n', hit)
+        if end == -1:
+            end = len(block)
+        panic_match = _PANIC_LOWER_RE.search(lowered, start, end)
+        if panic_match:
+            yield start, end, panic_match
+        pos = end + 1
+
+def _analyze_panic_patterns(blocks, verbose, fail_fast=False):
+    """Scans blocks of disassembly for panic patterns and returns found references."""
     found_panics = []
-    lines = content.split('\n')
     current_function = None
-    for line_num, line in enumerate(lines, 1):
-        # Skip disassembler comments that contain false positive int_log10 references
-        if re.match(r'^ *;.*int_log10::panic_for_nonpositive_argument', line):
-            if verbose:
-                print(f"Skipping false positive at line {line_num}: {line.strip()}")
-            continue
-
-        function_header_line = False
-        if '<' in line and '>' in line and line.endswith(':'):
-            match = re.search(r'<(.+)>:', line)
-            if match:
-                current_function = match.group(1)
-                function_header_line = True
-        for pattern in panic_patterns:
-            if re.search(pattern, line, re.IGNORECASE):
-                context_info = "" if function_header_line else f" [from {current_function}]" if current_function else ""
-                found_panics.append(f"Line {line_num}: {line.strip()}{context_info}")
+    line_base = 0
+    for block in blocks:
+        headers = [(m.start(), m.group(1)) for m in _FUNC_HEADER_RE.finditer(block)]
+        header_starts = [offset for offset, _ in headers]
+        line_num = line_base + 1
+        counted = 0
+        for start, end, panic_match in _panic_line_matches(block):
+            line_num += block.count('\n', counted, start)
+            counted = start
+            line = block[start:end]
+
+            # Blank lines, section titles and the file format line can't hold a panic reference
+            if line[0] not in _SCAN_LINE_STARTS:
+                continue
+            # Skip disassembler comments that contain false positive int_log10 references
+            if _FALSE_POSITIVE_RE.match(line):
                 if verbose:
-                    print(f"Found panic pattern '{pattern}' at line {line_num}: {line.strip()}{context_info}")
-                break
+                    print(f"Skipping false positive at line {line_num}: {line.strip()}")
+                continue
+
+            i = bisect.bisect_right(header_starts, start) - 1
+            if i >= 0 and header_starts[i] == start:
+                context_info = ""
+            else:
+                function = headers[i][1] if i >= 0 else current_function
+                context_info = f" [from {function}]" if function else ""
+            found_panics.append(f"Line {line_num}: {line.strip()}{context_info}")
+            if verbose:
+                pattern = block[panic_match.start():panic_match.end()]
+                print(f"Found panic pattern '{pattern}' at line {line_num}: {line.strip()}{context_info}")
+            if fail_fast:
+                return found_panics
+
+        if headers:
+            current_function = headers[-1][1]
+        line_base += block.count('\n')
     return found_panics
 
+def _scan_objdump(elf_path, verbose, asm_file=None, fail_fast=False):
+    """Disassembles a built ELF and returns (returncode, stderr, asm_blocks, found_panics)."""
+    cmd = [_llvm_objdump()] + _OBJDUMP_ARGS + [elf_path]
+
+    if verbose:
+        print(f"Running: {' '.join(cmd)}")
+
+    asm_blocks = None if asm_file else []
+    timed_out = threading.Event()
+    # stderr goes to a file, a pipe nobody reads while stdout streams could fill up and block
+    with tempfile.TemporaryFile(mode="w+") as stderr_file, \
+            open(asm_file, 'w', buffering=1 << 20) if asm_file else contextlib.nullcontext() as asm_out:
+        collect = asm_out.write if asm_file else asm_blocks.append
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True) as proc:
+
+            def kill():
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(120, kill)  # 2 minute timeout
+            timer.start()
+            try:
+                blocks = _filter_objdump_output(proc.stdout, collect)
+                found_panics = _analyze_panic_patterns(blocks, verbose, fail_fast)
+                stopped_early = fail_fast and found_panics
+                if stopped_early:
+                    proc.kill()
+                proc.wait()
+            finally:
+                timer.cancel()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, 120)
+        # Only read back when it is reported, on failure
+        stderr = ""
+        if proc.returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read() or f"exit code {proc.returncode}"
+
+    returncode = 0 if stopped_early else proc.returncode
+    return returncode, stderr, asm_blocks, found_panics
+
 def _report_panic_results(example_name, asm_file, found_panics):
     """Prints the results and returns the final boolean."""
     if found_panics:
-        print(f"❌ FAIL: Found {len(found_panics)} panic reference(s) in '{example_name}':")
+        lines = [f"❌ FAIL: Found {len(found_panics)} panic reference(s) in '{example_name}':"]
         for ref in found_panics:
             line_match = ref.split(": ", 1)
             if len(line_match) == 2:
                 line_part, content = line_match
                 line_num = line_part.replace("Line ", "")
-                print(f"{asm_file}:{line_num}: {content}")
+                lines.append(f"{asm_file}:{line_num}: {content}")
             else:
-                print(f"  {ref}")
+                lines.append(f"  {ref}")
+        sys.stdout.write("\n".join(lines) + "\n")
         return False
     else:
         print(f"✅ PASS: No panic references found in '{example_name}'")
         return True
 
-def run_panic_checker(example_name, profile="dev", verbose=False, no_default_features=False, features=None):
+def run_panic_checker(example_name, profile="dev", verbose=False, no_default_features=False, features=None, pending=None,
+                      fail_fast=False):
     """Run panic checker on a specific example."""
     print(f"🔍 Checking example '{example_name}' for panic references...")
     try:
-        result = _run_objdump(example_name, profile, verbose, no_default_features, features)
-        if result.returncode != 0:
-            print(f"❌ Error running objdump: {result.stderr}", file=sys.stderr)
+        asm_file = None
+        if pending is not None:
+            returncode, stderr, asm_blocks, found_panics = pending.result()
+        else:
+            elf_paths = dict(_build_examples([example_name], profile, verbose, no_default_features, features))
+            # Verbose mode always keeps the assembly, so write it out while scanning
+            if verbose:
+                asm_file = _assembly_path(example_name, profile)
+            returncode, stderr, asm_blocks, found_panics = _scan_objdump(elf_paths[example_name], verbose, asm_file, fail_fast)
+        if returncode != 0:
+            print(f"❌ Error running objdump: {stderr}", file=sys.stderr)
             return False
 
-        filtered_output = _filter_objdump_output(result.stdout)
-        asm_file = _save_assembly_output(example_name, profile, filtered_output)
-        found_panics = _analyze_panic_patterns(filtered_output, verbose)
+        # With fail_fast, objdump was stopped at the first hit and the assembly is cut short there
+        partial = fail_fast and bool(found_panics)
+        # The assembly is only needed to look up panic hits, or to inspect in verbose mode
+        if asm_file is not None:
+            print(_assembly_saved_message(asm_file, partial))
+        elif found_panics or verbose:
+            asm_file = _save_assembly_output(example_name, profile, asm_blocks, partial)
         return _report_panic_results(example_name, asm_file, found_panics)
 
     except subprocess.TimeoutExpired:
         print("❌ Error: objdump command timed out", file=sys.stderr)
         return False
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Error building example: {e.output}", file=sys.stderr)
+        return False
+    except KeyError:
+        print(f"❌ Error: cargo did not produce an executable for '{example_name}'", file=sys.stderr)
+        return False
     except Exception as e:
         print(f"❌ Error running objdump: {e}", file=sys.stderr)
         return False
 
+@functools.lru_cache(maxsize=1)
 def get_available_examples():
     """Auto-discover available examples from the examples/ directory."""
-    examples = []
     examples_dir = "examples"
 
-    if os.path.exists(examples_dir):
-        examples.extend(
-            file[:-3]
-            for file in os.listdir(examples_dir)
-            if file.endswith('.rs')
+    if not os.path.exists(examples_dir):
+        return []
+    with os.scandir(examples_dir) as entries:
+        return sorted(
+            entry.name[:-3]
+            for entry in entries
+            if entry.name.endswith('.rs') and entry.is_file()
         )
-    return sorted(examples)
 
-def run_panic_analysis(specific_examples=None):
+# Panic check result for an example that cargo couldn't build
+_BUILD_ERROR = "⚠️ BUILD ERROR"
+
+def run_panic_analysis(specific_examples=None, fail_fast=False):
     """Run panic checker on specified examples or all available ones."""
     examples = specific_examples or get_available_examples()
     results = {}
@@ -305,38 +777,63 @@ def run_panic_analysis(specific_examples=None):
     print("\n=== Panic Reference Analysis ===")
     print(f"Checking {len(examples)} example(s): {', '.join(examples)}")
 
+    # Check if examples exist
+    found = []
     for example in examples:
-        # Check if example exists
         example_path = f"examples/{example}.rs"
-        if not os.path.exists(example_path):
-            print(f"⚠️  Skipping {example} - file not found")
+        if os.path.exists(example_path):
+            found.append(example)
+        else:
             results[example] = "Not Found"
-            continue
 
-        success = run_panic_checker(example, verbose=False)
-        results[example] = "✅ PASS" if success else "❌ FAIL"
-        print()  # Add spacing between examples
+    # Build every example in one cargo invocation and disassemble each one directly as
+    # soon as cargo reports it built. The scans run concurrently, but are analyzed and
+    # reported one at a time in order so the output doesn't interleave.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=_parallel_workers()) as executor:
+        pending = {}
+        if found:
+            try:
+                for example, elf_path in _build_examples(found, "dev", False, False, None):
+                    if example in found and example not in pending:
+                        pending[example] = executor.submit(_scan_objdump, elf_path, False, None, fail_fast)
+            except subprocess.CalledProcessError as e:
+                print(f"❌ Error building examples: {e.output}", file=sys.stderr)
 
-    return results
+        for example in examples:
+            if example not in found:
+                print(f"⚠️  Skipping {example} - file not found")
+                continue
+            if example not in pending:
+                print(f"⚠️  BUILD ERROR: No executable was built for '{example}'")
+                results[example] = _BUILD_ERROR
+                continue
+
+            success = run_panic_checker(example, verbose=False, pending=pending[example], fail_fast=fail_fast)
+            results[example] = "✅ PASS" if success else "❌ FAIL"
+            print()  # Add spacing between examples
+
+    return {example: results[example] for example in examples}
 
 def print_panic_report(results):
     """Print a summary of panic check results."""
     header = "| Example | Panic Check Result |"
     separator = "|---|---|"
-    print("\n--- Panic Analysis Summary ---")
-    print(header)
-    print(separator)
-
-    for example, result in results.items():
-        print(f"| {example} | {result} |")
+    lines = ["\n--- Panic Analysis Summary ---", header, separator]
+    lines.extend(f"| {example} | {result} |" for example, result in results.items())
+    sys.stdout.write("\n".join(lines) + "\n")
 
     # Overall status
     failed_count = sum("FAIL" in r for r in results.values())
-    total_count = len([r for r in results.values() if r != "Not Found"])
+    build_error_count = sum(r == _BUILD_ERROR for r in results.values())
+    total_count = len([r for r in results.values() if r not in ("Not Found", _BUILD_ERROR)])
 
+    if build_error_count > 0:
+        print(f"\n❌ OVERALL: {build_error_count} example(s) failed to build")
     if failed_count > 0:
         print(f"\n❌ OVERALL: {failed_count}/{total_count} examples have panic references")
         return False
+    elif build_error_count > 0:
+        return False
     else:
         print(f"\n✅ OVERALL: All {total_count} examples are panic-free!")
         return True
@@ -344,14 +841,24 @@ def print_panic_report(results):
 def _print_panic_usage():
     """Prints the usage instructions for the panic checker."""
     available = get_available_examples()
-    print("Available examples for panic checking:")
-    for example in available:
-        print(f"  - {example}")
-    print("\nUsage:")
-    print("  python run_suite.py panic --example <name>                                    # Check specific example")
-    print("  python run_suite.py panic --example <name> --no-default-features             # Check without default features")
-    print("  python run_suite.py panic --example <name> --features depth-7,pico-tiny      # Check with specific features")
-    print("  python run_suite.py panic --examples                                          # Check all examples")
+    lines = ["Available examples for panic checking:"]
+    lines.extend(f"  - {example}" for example in available)
+    lines += [
+        "\nUsage:",
+        "  python run_suite.py panic --example <name>                                    # Check specific example",
+        "  python run_suite.py panic --example <name> --no-default-features              # Check without default features",
+        "  python run_suite.py panic --example <name> --features depth-7,pico-tiny       # Check with specific features",
+        "  python run_suite.py panic --examples                                          # Check all examples",
+        "  python run_suite.py panic --examples --fail-fast                              # Stop each check at its first panic",
+    ]
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def _depths_arg(value):
+    """argparse type for --depths: a comma-separated list of nesting depths."""
+    try:
+        return [int(d) for d in value.replace(',', ' ').split()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid depth list: '{value}'")
 
 def main():
     """Main entry point for the script."""
@@ -368,6 +875,16 @@ def main():
         action="store_true",
         help="Quick mode: only test the first depth (7) for faster iteration"
     )
+    parser.add_argument(
+        "--depths",
+        type=_depths_arg,
+        help="For stack analysis: comma-separated nesting depths to test instead of the DEPTHS in build.rs (e.g., '7,9,30')"
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="For stack analysis: reuse cached results for binaries already run with the same simavr"
+    )
     parser.add_argument(
         "--example",
         help="For panic checking: specify a single example to check (e.g., 'minimal')"
@@ -382,6 +899,11 @@ def main():
         action="store_true",
         help="Verbose output for panic checking"
     )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="For panic checking: stop scanning an example at its first panic reference"
+    )
     parser.add_argument(
         "--no-default-features",
         action="store_true",
@@ -393,21 +915,20 @@ def main():
     )
     args = parser.parse_args()
 
+    _use_native_target_dir_on_wsl()
+
     if args.tool == "stack":
+        # build.rs is only read when no depths were given
+        depths = args.depths or get_depths_from_build_rs()
+
         # Use only first depth if quick mode is enabled
-        global DEPTHS
         if args.quick:
-            original_depths = DEPTHS
-            DEPTHS = [DEPTHS[0]] if DEPTHS else [7]  # Use first depth or fallback to 7
-            print(f"Quick mode: Testing only depth {DEPTHS[0]}")
+            depths = [depths[0]] if depths else [7]  # Use first depth or fallback to 7
+            print(f"Quick mode: Testing only depth {depths[0]}")
 
-        results = run_stack_analysis()
+        results = run_stack_analysis(depths, use_cache=args.cache)
         print_stack_report(results)
 
-        # Restore original depths
-        if args.quick:
-            DEPTHS = original_depths
-
     elif args.tool == "bloat":
         results = run_bloat_analysis()
         print_bloat_report(results)
@@ -419,12 +940,13 @@ def main():
                 args.example,
                 verbose=args.verbose,
                 no_default_features=args.no_default_features,
-                features=args.features
+                features=args.features,
+                fail_fast=args.fail_fast,
             )
             sys.exit(0 if success else 1)
         elif args.examples:
             # Check all available examples
-            results = run_panic_analysis()
+            results = run_panic_analysis(fail_fast=args.fail_fast)
             success = print_panic_report(results)
             sys.exit(0 if success else 1)
         else:
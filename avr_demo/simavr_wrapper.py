@@ -1,16 +1,23 @@
 import platform
+import re
 import subprocess
 import sys
 import os
-import argparse
-import shlex
+import functools
+import hashlib
+import shutil
 
-def run_simavr_posix(binary, simavr_args, timeout_seconds=None):
-    """Run simavr directly on Linux with all arguments passed through."""
+def posix_command(binary, simavr_args, timeout_seconds=None):
+    """Build the command line for running simavr directly on Linux/macOS."""
     cmd = ["simavr"] + simavr_args + [binary]
 
     if timeout_seconds:
         cmd = ["timeout", str(timeout_seconds)] + cmd
+    return cmd
+
+def run_simavr_posix(binary, simavr_args, timeout_seconds=None):
+    """Run simavr directly on Linux with all arguments passed through."""
+    cmd = posix_command(binary, simavr_args, timeout_seconds)
 
     try:
         result = subprocess.run(cmd, check=False)
@@ -19,26 +26,46 @@ def run_simavr_posix(binary, simavr_args, timeout_seconds=None):
         print("Error: simavr not found. Please ensure it's installed and in PATH.", file=sys.stderr)
         return 1
 
-def run_simavr_windows(binary, simavr_args, timeout_seconds=None):
-    """Run simavr through WSL on Windows with path conversion."""
-    try:
-        abs_binary_path = os.path.abspath(binary)
-        normalized_path = abs_binary_path.replace('\\', '/')
-
-        wsl_binary_result = subprocess.run(
-            ["wsl", "wslpath", "-u", normalized_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        wsl_binary_path = wsl_binary_result.stdout.strip()
+_DRIVE_PATH_RE = re.compile(r"^([A-Za-z]):[\\/](.*)$")
+
+def _win_to_wsl(win_path):
+    """Map a plain drive path like C:/foo/bar.elf to /mnt/c/foo/bar.elf, or None if it isn't one."""
+    match = _DRIVE_PATH_RE.match(win_path)
+    if not match:
+        return None
+    return f"/mnt/{match[1].lower()}/{match[2].replace(chr(92), '/')}"
+
+@functools.lru_cache(maxsize=256)
+def _wslpath_u(win_path):
+    """Convert a Windows path to its WSL equivalent, caching the result per path."""
+    wsl_binary_result = subprocess.run(
+        ["wsl", "wslpath", "-u", win_path],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return wsl_binary_result.stdout.strip()
+
+def windows_command(binary, simavr_args, timeout_seconds=None):
+    """Build the command line for running simavr through WSL, converting the binary path."""
+    abs_binary_path = os.path.abspath(binary)
+    normalized_path = abs_binary_path.replace('\\', '/')
+    # Drive paths follow the default /mnt/<drive> automount convention, anything
+    # else (UNC paths, custom mounts) still goes through wslpath
+    wsl_binary_path = _win_to_wsl(normalized_path) or _wslpath_u(normalized_path)
+
+    simavr_cmd_parts = ["simavr"] + simavr_args + [wsl_binary_path]
 
-        simavr_cmd_parts = ["simavr"] + simavr_args + [wsl_binary_path]
+    if timeout_seconds:
+        simavr_cmd_parts = ["timeout", str(timeout_seconds)] + simavr_cmd_parts
 
-        if timeout_seconds:
-            simavr_cmd_parts = ["timeout", str(timeout_seconds)] + simavr_cmd_parts
+    # `wsl -e` execs the command directly, no intermediate shell or quoting needed
+    return ["wsl", "-e"] + simavr_cmd_parts
 
-        cmd = ["wsl", "-e", "bash", "-c", " ".join(shlex.quote(part) for part in simavr_cmd_parts)]
+def run_simavr_windows(binary, simavr_args, timeout_seconds=None):
+    """Run simavr through WSL on Windows with path conversion."""
+    try:
+        cmd = windows_command(binary, simavr_args, timeout_seconds)
         result = subprocess.run(cmd, check=False)
         return result.returncode
 
@@ -49,37 +76,89 @@ def run_simavr_windows(binary, simavr_args, timeout_seconds=None):
         print("Error: WSL not found. Please ensure WSL is installed and configured.", file=sys.stderr)
         return 1
 
-def main():
-    # Custom parsing needed because argparse can't handle mixed arguments properly
-    # We need to extract -t/--timeout but pass everything else to simavr
-    timeout_seconds = None
-    simavr_args = []
-    binary = None
+def simavr_command(binary, simavr_args, timeout_seconds=None):
+    """Build the simavr command line for the current platform."""
+    system = platform.system().lower()
+    if system in ["linux", "darwin"]:
+        return posix_command(binary, simavr_args, timeout_seconds)
+    elif system == "windows":
+        return windows_command(binary, simavr_args, timeout_seconds)
+    raise OSError(f"Unsupported operating system: {system}")
 
-    i = 1  # Skip script name
-    while i < len(sys.argv):
-        arg = sys.argv[i]
+@functools.lru_cache(maxsize=1)
+def simavr_version():
+    """Identify the installed simavr by a SHA-256 of its executable, or return None if it can't be found."""
+    system = platform.system().lower()
+    if system in ["linux", "darwin"]:
+        path = shutil.which("simavr")
+        if path is None:
+            return None
+        digest = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        return digest.hexdigest()
+    elif system == "windows":
+        # Hash the simavr that `wsl -e simavr` would run, inside WSL
+        command = ["wsl", "-e", "sh", "-c", 'sha256sum "$(command -v simavr)"']
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0 or not result.stdout.strip():
+            return None
+        return result.stdout.split()[0]
+    return None
+
+_BIN_EXTS = frozenset({'.elf', '.bin', '.hex'})
+
+def _positive_int(value):
+    """Parse the timeout value: a strictly positive integer, or None if it isn't one."""
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    return number if number > 0 else None
 
-        if arg in ['-t', '--timeout']:
-            if i + 1 >= len(sys.argv):
+def split_timeout(argv):
+    """Split the wrapper's own -t/--timeout option from the arguments meant for simavr."""
+    timeout_seconds = None
+    simavr_args = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ("-t", "--timeout"):
+            if i + 1 >= len(argv):
                 print("Error: -t/--timeout requires a value", file=sys.stderr)
                 sys.exit(1)
-            try:
-                timeout_seconds = int(sys.argv[i + 1])
-                if timeout_seconds <= 0:
-                    raise ValueError()
-            except ValueError:
-                print("Error: timeout value must be a positive integer", file=sys.stderr)
-                sys.exit(1)
-            i += 2  # Skip both the flag and its value
-        elif arg.endswith('.elf') or arg.endswith('.bin') or arg.endswith('.hex'):
-            # This looks like a binary file
-            binary = arg
+            value = argv[i + 1]
+            i += 2
+        elif arg.startswith("--timeout="):
+            value = arg[len("--timeout="):]
             i += 1
         else:
-            # This is a simavr argument
             simavr_args.append(arg)
             i += 1
+            continue
+        timeout_seconds = _positive_int(value)
+        if timeout_seconds is None:
+            print("Error: timeout value must be a positive integer", file=sys.stderr)
+            sys.exit(1)
+    return timeout_seconds, simavr_args
+
+def main():
+    # Only -t/--timeout belongs to the wrapper, everything else is passed to simavr.
+    # The binary can't be told apart from simavr option values (e.g. `-m atmega2560`)
+    # by position, so it is picked out by extension instead.
+    timeout_seconds, simavr_args = split_timeout(sys.argv[1:])
+
+    # Anything that looks like a binary file is the binary, the last one wins
+    binaries = [arg for arg in simavr_args if os.path.splitext(arg)[1].lower() in _BIN_EXTS]
+    simavr_args = [arg for arg in simavr_args if arg not in binaries]
+    binary = binaries[-1] if binaries else None
 
     # If no binary was found, assume the last argument is the binary
     if binary is None and simavr_args:
@@ -90,10 +169,6 @@ def main():
         print("Usage: simavr_wrapper.py [-t timeout] [simavr_args...] <binary.elf>", file=sys.stderr)
         sys.exit(1)
 
-    if not os.path.exists(binary):
-        print(f"Error: Binary file '{binary}' not found.", file=sys.stderr)
-        sys.exit(1)
-
     system = platform.system().lower()
 
     if system in ["linux", "darwin"]:
@@ -104,6 +179,10 @@ def main():
         print(f"Error: Unsupported operating system: {system}", file=sys.stderr)
         sys.exit(1)
 
+    # simavr reports a missing binary itself, only stat it to explain a failure
+    if exit_code != 0 and not os.path.exists(binary):
+        print(f"Error: Binary file '{binary}' not found.", file=sys.stderr)
+
     sys.exit(exit_code)
 
 if __name__ == "__main__":